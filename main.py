@@ -1,10 +1,12 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
 from pathlib import Path
+from functools import lru_cache
+import os
+import shutil
 import unicodedata
 import io
 
@@ -47,29 +49,47 @@ SCHOOL_COLOR = {
     "동산고": "#d62728",
 }
 
+# 행마다 문자열/실수를 저장하지 않도록 범주형으로 보관
+SCHOOL_DTYPE = pd.CategoricalDtype(list(SCHOOL_EC_INFO.keys()))
+EC_DTYPE = pd.CategoricalDtype(sorted(set(SCHOOL_EC_INFO.values())))
+
 # =========================
 # 유틸: NFC/NFD 파일 탐색
 # =========================
-def find_file_by_name(directory: Path, target_name: str):
-    target_nfc = unicodedata.normalize("NFC", target_name)
-    target_nfd = unicodedata.normalize("NFD", target_name)
-
-    for f in directory.iterdir():
+@lru_cache(maxsize=1)
+def _dir_index(dir_str: str):
+    index = {}
+    for f in Path(dir_str).iterdir():
         if not f.is_file():
             continue
-        name_nfc = unicodedata.normalize("NFC", f.name)
-        name_nfd = unicodedata.normalize("NFD", f.name)
+        index[unicodedata.normalize("NFC", f.name)] = f
+        index[unicodedata.normalize("NFD", f.name)] = f
+    return index
+
+def find_file_by_name(directory: Path, target_name: str):
+    index = _dir_index(str(directory))
+    return (
+        index.get(unicodedata.normalize("NFC", target_name))
+        or index.get(unicodedata.normalize("NFD", target_name))
+    )
+
+# =========================
+# 유틸: Parquet 캐시
+# =========================
+# 로더의 출력 형태(컬럼/dtype)가 바뀌면 올려서 기존 캐시를 무효화
+PARQUET_CACHE_VERSION = 3
 
-        if name_nfc == target_nfc or name_nfd == target_nfd:
-            return f
-    return None
+def _cache_is_fresh(cache_path: Path, sources):
+    return cache_path.exists() and all(
+        cache_path.stat().st_mtime >= src.stat().st_mtime for src in sources
+    )
 
 # =========================
 # 데이터 로딩
 # =========================
 @st.cache_data
 def load_environment_data():
-    env_data = {}
+    file_paths = {}
 
     for school in SCHOOL_EC_INFO.keys():
         filename = f"{school}_환경데이터.csv"
@@ -77,13 +97,53 @@ def load_environment_data():
 
         if file_path is None:
             st.error(f"환경 데이터 파일을 찾을 수 없습니다: {filename}")
-            return None
-
-        df = pd.read_csv(file_path)
-        df["school"] = school
-        env_data[school] = df
+            return None, None
+
+        file_paths[school] = file_path
+
+    cache_path = DATA_DIR / f"env_all.v{PARQUET_CACHE_VERSION}.parquet"
+
+    env_all = None
+
+    if _cache_is_fresh(cache_path, file_paths.values()):
+        try:
+            env_all = pd.read_parquet(cache_path, engine="pyarrow")
+        except (OSError, ValueError):
+            pass  # 손상된 캐시는 캐시 미스로 처리
+
+    if env_all is None:
+        env_frames = []
+
+        for school, file_path in file_paths.items():
+            df = pd.read_csv(file_path, engine="pyarrow", dtype_backend="pyarrow")
+            df["time"] = pd.to_datetime(df["time"], format="mixed")
+            for col in ["temperature", "humidity", "ph", "ec"]:
+                df[col] = pd.to_numeric(df[col], downcast="float")
+            df["school"] = pd.Categorical([school] * len(df), dtype=SCHOOL_DTYPE)
+            env_frames.append(df)
+
+        env_all = pd.concat(env_frames, ignore_index=True)
+
+        # 임시 파일에 쓴 뒤 교체해 중간에 끊겨도 잘린 캐시가 남지 않도록 함
+        tmp_path = cache_path.with_name(f"env_all.v{PARQUET_CACHE_VERSION}.tmp.parquet")
+        try:
+            env_all.to_parquet(tmp_path, engine="pyarrow", index=False)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)  # 쓰기 불가 환경에서는 캐시 없이 진행
+
+    # 시계열 그래프용 long-form (캐시)
+    env_long = env_all.melt(
+        id_vars=["school", "time"],
+        value_vars=["temperature", "humidity", "ec"],
+        var_name="variable",
+        value_name="value"
+    )
+    env_long["variable"] = env_long["variable"].map(
+        {"temperature": "온도", "humidity": "습도", "ec": "EC"}
+    )
 
-    return env_data
+    return env_all, env_long
 
 @st.cache_data
 def load_growth_data():
@@ -95,27 +155,202 @@ def load_growth_data():
 
     if xlsx_path is None:
         st.error("생육 결과 XLSX 파일을 찾을 수 없습니다.")
-        return None
+        return None, None, None
 
-    excel = pd.ExcelFile(xlsx_path, engine="openpyxl")
+    cache_dir = xlsx_path.with_suffix(f".v{PARQUET_CACHE_VERSION}.parquet.dir")
     growth_data = {}
 
-    for sheet in excel.sheet_names:
-        df = excel.parse(sheet)
-        df["school"] = sheet
-        df["ec"] = SCHOOL_EC_INFO.get(sheet, None)
-        growth_data[sheet] = df
+    # 시트 순서 유지를 위해 "{순번}_{시트명}.parquet" 으로 저장
+    if _cache_is_fresh(cache_dir, [xlsx_path]):
+        try:
+            for f in sorted(cache_dir.glob("*.parquet")):
+                sheet = unicodedata.normalize("NFC", f.stem.split("_", 1)[1])
+                growth_data[sheet] = pd.read_parquet(f, engine="pyarrow")
+        except (OSError, ValueError):
+            growth_data = {}  # 손상된 캐시는 캐시 미스로 처리
+
+    if not growth_data:
+        excel = pd.ExcelFile(xlsx_path, engine="openpyxl")
+
+        for sheet in excel.sheet_names:
+            df = excel.parse(sheet)
+            for col in ["지상부 길이(mm)", "지하부길이(mm)", "생중량(g)"]:
+                df[col] = pd.to_numeric(df[col], downcast="float")
+            for col in ["개체번호", "잎 수(장)"]:
+                df[col] = pd.to_numeric(df[col], downcast="integer")
+            df["school"] = sheet
+            df["ec"] = SCHOOL_EC_INFO.get(sheet, None)
+            growth_data[sheet] = df
+
+        # 임시 디렉터리에 모든 시트를 쓴 뒤 교체해 일부 시트만 담긴 캐시가 남지 않도록 함
+        tmp_dir = xlsx_path.with_suffix(f".v{PARQUET_CACHE_VERSION}.tmp.parquet.dir")
+        try:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            tmp_dir.mkdir()
+            for i, (sheet, df) in enumerate(growth_data.items()):
+                df.to_parquet(tmp_dir / f"{i:02d}_{sheet}.parquet", engine="pyarrow", index=False)
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            os.replace(tmp_dir, cache_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)  # 쓰기 불가 환경에서는 캐시 없이 진행
+
+    # 통합 데이터 + EC별 요약 (캐시)
+    growth_all = pd.concat(growth_data.values(), ignore_index=True)
+    # 범주형 변환은 통합 후 수행 (Parquet 왕복 시 실수형 범주가 풀림)
+    growth_all["school"] = growth_all["school"].astype(SCHOOL_DTYPE)
+    growth_all["ec"] = growth_all["ec"].astype(EC_DTYPE)
+    growth_summary = growth_all.groupby("ec", observed=True).agg(
+        weight=("생중량(g)", "mean"),
+        leaves=("잎 수(장)", "mean"),
+        length=("지상부 길이(mm)", "mean"),
+        n=("생중량(g)", "size"),
+    ).reset_index()
+
+    return growth_data, growth_all, growth_summary
+
+# =========================
+# 다운로드용 직렬화 (캐시)
+# =========================
+# 다운로드 버튼 클릭 시에만 호출됨 (st.download_button에 callable로 전달)
+# DataFrame 해싱을 피하기 위해 _df는 캐시 키에서 제외하고 cache_key로 구분
+# float32 값의 표현 오차(21.170000076...)가 파일에 남지 않도록 유효숫자 6자리로 출력
+@st.cache_data
+def to_csv_bytes(_df: pd.DataFrame, cache_key):
+    return _df.to_csv(index=False, float_format="%.6g").encode("utf-8")
+
+@st.cache_data
+def to_xlsx_bytes(_df: pd.DataFrame, cache_key):
+    buffer = io.BytesIO()
+    _df.to_excel(buffer, index=False, engine="xlsxwriter", float_format="%.6g")
+    return buffer.getvalue()
+
+# =========================
+# 그래프 생성 (캐시)
+# =========================
+# 데이터는 프로세스 동안 고정이므로 _로 시작하는 인자는 해싱하지 않음
+FONT = dict(family="Malgun Gothic, Apple SD Gothic Neo, sans-serif")
+
+@st.cache_resource
+def build_env_avg_fig(_env_all):
+    avg_df = _env_all.groupby("school", sort=False, observed=True).agg(
+        temperature=("temperature", "mean"),
+        humidity=("humidity", "mean"),
+        ph=("ph", "mean"),
+        ec_measured=("ec", "mean"),
+    ).reset_index()
+    schools = avg_df["school"]
+    avg_df["ec_target"] = schools.map(SCHOOL_EC_INFO).astype(float)
+
+    fig = make_subplots(
+        rows=2, cols=2,
+        subplot_titles=("평균 온도", "평균 습도", "평균 pH", "목표 EC vs 실측 EC")
+    )
+
+    fig.add_bar(x=schools, y=avg_df["temperature"], row=1, col=1)
+    fig.add_bar(x=schools, y=avg_df["humidity"], row=1, col=2)
+    fig.add_bar(x=schools, y=avg_df["ph"], row=2, col=1)
+
+    fig.add_bar(
+        x=schools,
+        y=avg_df["ec_target"],
+        name="목표 EC",
+        row=2, col=2
+    )
+    fig.add_bar(
+        x=schools,
+        y=avg_df["ec_measured"],
+        name="실측 EC",
+        row=2, col=2
+    )
+
+    fig.update_layout(height=600, font=FONT, barmode="group")
+    return fig
+
+@st.cache_resource
+def build_env_ts_fig(_env_long, school_option):
+    if school_option == "전체":
+        schools_to_plot = list(SCHOOL_EC_INFO.keys())
+    else:
+        schools_to_plot = [school_option]
+
+    fig = px.line(
+        _env_long[_env_long["school"].isin(schools_to_plot)],
+        x="time",
+        y="value",
+        color="school",
+        facet_row="variable",
+        color_discrete_map=SCHOOL_COLOR,
+        render_mode="webgl"
+    )
+    fig.update_yaxes(matches=None, title_text="")
+    fig.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1]))
+
+    # 목표 EC (px facet_row는 아래에서부터 row 1 → EC 패널)
+    for school in schools_to_plot:
+        fig.add_hline(
+            y=SCHOOL_EC_INFO[school],
+            line_dash="dash",
+            line_color=SCHOOL_COLOR[school],
+            annotation_text=f"{school} 목표 EC",
+            row=1, col=1
+        )
+
+    fig.update_layout(height=800, font=FONT)
+    return fig
 
-    return growth_data
+@st.cache_resource
+def build_growth_summary_fig(_growth_summary):
+    fig = make_subplots(
+        rows=2, cols=2,
+        subplot_titles=(
+            "평균 생중량",
+            "평균 잎 수",
+            "평균 지상부 길이",
+            "개체수"
+        )
+    )
+
+    ec = _growth_summary["ec"]
+    for metric, (row, col) in zip(
+        ["weight", "leaves", "length", "n"],
+        [(1, 1), (1, 2), (2, 1), (2, 2)]
+    ):
+        fig.add_bar(x=ec, y=_growth_summary[metric], row=row, col=col)
+
+    fig.update_layout(height=600, font=FONT)
+    return fig
+
+@st.cache_resource
+def build_growth_box_fig(_growth_all):
+    fig = px.box(
+        _growth_all,
+        x="school",
+        y="생중량(g)",
+        color="school"
+    )
+    fig.update_layout(font=FONT)
+    return fig
+
+@st.cache_resource
+def build_growth_scatter_fig(_growth_all, x):
+    fig = px.scatter(
+        _growth_all,
+        x=x,
+        y="생중량(g)",
+        color="school",
+        render_mode="webgl"
+    )
+    fig.update_layout(font=FONT)
+    return fig
 
 # =========================
 # 데이터 로딩 실행
 # =========================
 with st.spinner("데이터 로딩 중..."):
-    env_data = load_environment_data()
-    growth_data = load_growth_data()
+    env_all, env_long = load_environment_data()
+    growth_data, growth_all, growth_summary = load_growth_data()
 
-if env_data is None or growth_data is None:
+if env_all is None or growth_data is None:
     st.stop()
 
 # =========================
@@ -137,10 +372,12 @@ st.title("🌱 극지식물 최적 EC 농도 연구")
 # =========================
 tab1, tab2, tab3 = st.tabs(["📖 실험 개요", "🌡️ 환경 데이터", "📊 생육 결과"])
 
+# 각 탭은 fragment로 분리: 탭 안의 위젯(다운로드 버튼 등)은 해당 탭만 rerun
 # ======================================================
 # Tab 1: 실험 개요
 # ======================================================
-with tab1:
+@st.fragment
+def render_tab1():
     st.subheader("연구 배경 및 목적")
     st.markdown(
         """
@@ -168,8 +405,7 @@ with tab1:
     st.dataframe(overview_df, use_container_width=True)
 
     # 주요 지표 카드
-    avg_temp = pd.concat(env_data.values())["temperature"].mean()
-    avg_hum = pd.concat(env_data.values())["humidity"].mean()
+    avg_temp, avg_hum = env_all[["temperature", "humidity"]].mean()
     optimal_ec = 2.0
 
     c1, c2, c3, c4 = st.columns(4)
@@ -178,208 +414,105 @@ with tab1:
     c3.metric("평균 습도", f"{avg_hum:.1f} %")
     c4.metric("최적 EC", f"{optimal_ec}")
 
+with tab1:
+    render_tab1()
+
 # ======================================================
 # Tab 2: 환경 데이터
 # ======================================================
-with tab2:
+@st.fragment
+def render_tab2(school_option):
     st.subheader("학교별 환경 평균 비교")
 
-    # 평균 계산
-    avg_rows = []
-    for school, df in env_data.items():
-        avg_rows.append({
-            "school": school,
-            "temperature": df["temperature"].mean(),
-            "humidity": df["humidity"].mean(),
-            "ph": df["ph"].mean(),
-            "ec_measured": df["ec"].mean(),
-            "ec_target": SCHOOL_EC_INFO[school]
-        })
-    avg_df = pd.DataFrame(avg_rows)
-
-    fig = make_subplots(
-        rows=2, cols=2,
-        subplot_titles=("평균 온도", "평균 습도", "평균 pH", "목표 EC vs 실측 EC")
+    st.plotly_chart(
+        build_env_avg_fig(env_all),
+        use_container_width=True,
+        key="env_avg_fig"
     )
 
-    fig.add_bar(x=avg_df["school"], y=avg_df["temperature"], row=1, col=1)
-    fig.add_bar(x=avg_df["school"], y=avg_df["humidity"], row=1, col=2)
-    fig.add_bar(x=avg_df["school"], y=avg_df["ph"], row=2, col=1)
-
-    fig.add_bar(
-        x=avg_df["school"],
-        y=avg_df["ec_target"],
-        name="목표 EC",
-        row=2, col=2
-    )
-    fig.add_bar(
-        x=avg_df["school"],
-        y=avg_df["ec_measured"],
-        name="실측 EC",
-        row=2, col=2
-    )
-
-    fig.update_layout(
-        height=600,
-        font=dict(family="Malgun Gothic, Apple SD Gothic Neo, sans-serif"),
-        barmode="group"
-    )
-
-    st.plotly_chart(fig, use_container_width=True)
-
     # 시계열
     st.subheader("환경 변화 시계열")
 
-    if school_option == "전체":
-        schools_to_plot = env_data.keys()
-    else:
-        schools_to_plot = [school_option]
-
-    for school in schools_to_plot:
-        df = env_data[school]
-        fig_ts = go.Figure()
-
-        fig_ts.add_scatter(x=df["time"], y=df["temperature"], name="온도")
-        fig_ts.add_scatter(x=df["time"], y=df["humidity"], name="습도")
-        fig_ts.add_scatter(x=df["time"], y=df["ec"], name="EC")
-
-        fig_ts.add_hline(
-            y=SCHOOL_EC_INFO[school],
-            line_dash="dash",
-            annotation_text="목표 EC"
-        )
-
-        fig_ts.update_layout(
-            title=f"{school} 환경 변화",
-            font=dict(family="Malgun Gothic, Apple SD Gothic Neo, sans-serif")
-        )
-
-        st.plotly_chart(fig_ts, use_container_width=True)
+    st.plotly_chart(
+        build_env_ts_fig(env_long, school_option),
+        use_container_width=True,
+        key="env_ts_fig"
+    )
 
     # 원본 데이터 + 다운로드
     with st.expander("환경 데이터 원본 보기 / 다운로드"):
-        all_env_df = pd.concat(env_data.values(), ignore_index=True)
-        st.dataframe(all_env_df, use_container_width=True)
-
-        buffer = io.BytesIO()
-        all_env_df.to_csv(buffer, index=False)
-        buffer.seek(0)
+        st.dataframe(env_all, use_container_width=True)
 
         st.download_button(
             "CSV 다운로드",
-            data=buffer,
+            data=lambda: to_csv_bytes(env_all, ("env_all", PARQUET_CACHE_VERSION, len(env_all))),
             file_name="환경데이터_전체.csv",
             mime="text/csv"
         )
 
+with tab2:
+    render_tab2(school_option)
+
 # ======================================================
 # Tab 3: 생육 결과
 # ======================================================
-with tab3:
+@st.fragment
+def render_tab3():
     st.subheader("🥇 EC별 평균 생중량")
 
-    growth_all = pd.concat(growth_data.values(), ignore_index=True)
-    ec_group = growth_all.groupby("ec")["생중량(g)"].mean().reset_index()
+    max_ec = growth_summary.loc[growth_summary["weight"].idxmax(), "ec"]
 
-    max_ec = ec_group.loc[ec_group["생중량(g)"].idxmax(), "ec"]
+    ecs = growth_summary["ec"].to_numpy()
+    weights = growth_summary["weight"].to_numpy()
 
-    c = st.columns(len(ec_group))
-    for i, row in ec_group.iterrows():
-        label = "⭐ 최적" if row["ec"] == max_ec else ""
-        c[i].metric(f"EC {row['ec']}", f"{row['생중량(g)']:.2f} g", label)
+    c = st.columns(len(growth_summary))
+    for i, (ec, weight) in enumerate(zip(ecs, weights)):
+        label = "⭐ 최적" if ec == max_ec else ""
+        c[i].metric(f"EC {ec}", f"{weight:.2f} g", label)
 
     # EC별 비교 그래프
-    fig2 = make_subplots(
-        rows=2, cols=2,
-        subplot_titles=(
-            "평균 생중량",
-            "평균 잎 수",
-            "평균 지상부 길이",
-            "개체수"
-        )
-    )
-
-    fig2.add_bar(
-        x=ec_group["ec"],
-        y=ec_group["생중량(g)"],
-        row=1, col=1
+    st.plotly_chart(
+        build_growth_summary_fig(growth_summary),
+        use_container_width=True,
+        key="growth_summary_fig"
     )
 
-    fig2.add_bar(
-        x=growth_all.groupby("ec")["잎 수(장)"].mean().index,
-        y=growth_all.groupby("ec")["잎 수(장)"].mean().values,
-        row=1, col=2
-    )
-
-    fig2.add_bar(
-        x=growth_all.groupby("ec")["지상부 길이(mm)"].mean().index,
-        y=growth_all.groupby("ec")["지상부 길이(mm)"].mean().values,
-        row=2, col=1
-    )
-
-    fig2.add_bar(
-        x=growth_all.groupby("ec").size().index,
-        y=growth_all.groupby("ec").size().values,
-        row=2, col=2
-    )
-
-    fig2.update_layout(
-        height=600,
-        font=dict(family="Malgun Gothic, Apple SD Gothic Neo, sans-serif")
-    )
-
-    st.plotly_chart(fig2, use_container_width=True)
-
     # 분포
     st.subheader("학교별 생중량 분포")
-    fig_box = px.box(
-        growth_all,
-        x="school",
-        y="생중량(g)",
-        color="school"
+    st.plotly_chart(
+        build_growth_box_fig(growth_all),
+        use_container_width=True,
+        key="growth_box_fig"
     )
-    fig_box.update_layout(
-        font=dict(family="Malgun Gothic, Apple SD Gothic Neo, sans-serif")
-    )
-    st.plotly_chart(fig_box, use_container_width=True)
 
     # 상관관계
     st.subheader("상관관계 분석")
     c1, c2 = st.columns(2)
 
     with c1:
-        fig_sc1 = px.scatter(
-            growth_all,
-            x="잎 수(장)",
-            y="생중량(g)",
-            color="school"
+        st.plotly_chart(
+            build_growth_scatter_fig(growth_all, "잎 수(장)"),
+            use_container_width=True,
+            key="growth_scatter_leaves_fig"
         )
-        fig_sc1.update_layout(font=dict(family="Malgun Gothic, Apple SD Gothic Neo, sans-serif"))
-        st.plotly_chart(fig_sc1, use_container_width=True)
 
     with c2:
-        fig_sc2 = px.scatter(
-            growth_all,
-            x="지상부 길이(mm)",
-            y="생중량(g)",
-            color="school"
+        st.plotly_chart(
+            build_growth_scatter_fig(growth_all, "지상부 길이(mm)"),
+            use_container_width=True,
+            key="growth_scatter_length_fig"
         )
-        fig_sc2.update_layout(font=dict(family="Malgun Gothic, Apple SD Gothic Neo, sans-serif"))
-        st.plotly_chart(fig_sc2, use_container_width=True)
 
     # 원본 데이터 + XLSX 다운로드
     with st.expander("생육 데이터 원본 보기 / 다운로드"):
         st.dataframe(growth_all, use_container_width=True)
 
-        buffer = io.BytesIO()
-        growth_all.to_excel(buffer, index=False, engine="openpyxl")
-        buffer.seek(0)
-
         st.download_button(
             "XLSX 다운로드",
-            data=buffer,
+            data=lambda: to_xlsx_bytes(growth_all, ("growth_all", PARQUET_CACHE_VERSION, len(growth_all))),
             file_name="생육결과_전체.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
 
-
+with tab3:
+    render_tab3()